@@ -1,9 +1,11 @@
 import asyncio
+import base64
 import json
 from contextlib import AsyncExitStack
 from typing import Any, Dict, List, Optional
 
 
+import numpy as np
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
@@ -17,6 +19,42 @@ import time
 load_dotenv(".env")
 
 
+def decode_ndarrays(value: Any) -> Any:
+    """Replace base64 float32 array envelopes from the server with nested lists.
+
+    Args:
+        value: A value decoded from a tool result's JSON.
+
+    Returns:
+        The same value with every {"__ndarray__": true, ...} envelope expanded.
+    """
+    if isinstance(value, dict):
+        if value.get("__ndarray__"):
+            data = base64.b64decode(value["data"])
+            return np.frombuffer(data, dtype="<f4").reshape(value["shape"]).tolist()
+        return {k: decode_ndarrays(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_ndarrays(v) for v in value]
+    return value
+
+
+def decode_tool_result(text: str) -> str:
+    """Expand array envelopes in a tool result so the model sees readable values.
+
+    Args:
+        text: The text content returned by an MCP tool.
+
+    Returns:
+        The text with array envelopes decoded, or unchanged if it is not JSON.
+    """
+    if "__ndarray__" not in text:
+        return text
+    try:
+        return json.dumps(decode_ndarrays(json.loads(text)))
+    except ValueError:
+        return text
+
+
 class MCPOpenAIClient:
     """Client for interacting with OpenAI models using MCP tools."""
 
@@ -136,7 +174,7 @@ class MCPOpenAIClient:
                     {
                         "role": "tool",
                         "tool_call_id": tool_call.id,
-                        "content": result.content[0].text,
+                        "content": decode_tool_result(result.content[0].text),
                     }
                 )
 
@@ -1,11 +1,21 @@
+import re
+import base64
 import sys
-import json
 import asyncio
 import logging
 import numpy as np
-from typing import Any, Dict, List 
+import orjson
+from typing import Any, Dict, List, Optional, Tuple 
 import tempfile 
 import os
+import atexit
+import shutil
+import hashlib
+import functools
+import concurrent.futures
+import contextlib
+from collections import OrderedDict
+import time
 
 # MCP specific imports
 from mcp.server.fastmcp import FastMCP
@@ -25,7 +35,7 @@ mcp = FastMCP("MatlabMCP")
 # --- MATLAB Engine Connection ---
 logger.info("Finding shared MATLAB sessions...")
 names = matlab.engine.find_matlab()
-logger.info(f"Found sessions: {names}")
+logger.info("Found sessions: %s", names)
 
 eng = None
 if not names:
@@ -34,130 +44,353 @@ if not names:
     sys.exit(1) # Exit if no MATLAB found
 else:
     session_name = names[0]
-    logger.info(f"Attempting to connect to MATLAB session: {session_name}")
+    logger.info("Attempting to connect to MATLAB session: %s", session_name)
     try:
         eng = matlab.engine.connect_matlab(session_name)
-        logger.info(f"Successfully connected to shared MATLAB session: {session_name}")
+        logger.info("Successfully connected to shared MATLAB session: %s", session_name)
     except matlab.engine.EngineError as e:
-        logger.error(f"Error connecting to MATLAB session '{session_name}': {e}", exc_info=True)
+        logger.error("Error connecting to MATLAB session '%s': %s", session_name, e, exc_info=True)
         sys.exit(1) # Exit if connection fails
     except Exception as e: # Catch any other unexpected connection error
-        logger.error(f"An unexpected error occurred while trying to connect to MATLAB: {e}", exc_info=True)
+        logger.error("An unexpected error occurred while trying to connect to MATLAB: %s", e, exc_info=True)
         sys.exit(1)
 
 if eng is None: # Should not be reached if sys.exit(1) was hit, but as a safeguard
     logger.critical("MATLAB engine 'eng' is None after connection attempt. Exiting.")
     sys.exit(1)
 
+# --- Script cache ---
+# Each distinct code string is written once as a script in a per-process directory on MATLAB's path,
+# so repeated submissions reuse MATLAB's already-parsed copy instead of re-reading a file.
+SCRIPT_CACHE_DIR = os.path.join(tempfile.gettempdir(), f"matlabmcp_{os.getpid()}")
+os.makedirs(SCRIPT_CACHE_DIR, exist_ok=True)
+eng.addpath(SCRIPT_CACHE_DIR, nargout=0)
+MAX_CACHED_SCRIPTS = 128
+_code_cache: "OrderedDict[str, str]" = OrderedDict() # code hash -> MATLAB script name, least recently used first
+
+def _remove_script_cache_dir():
+    try:
+        eng.rmpath(SCRIPT_CACHE_DIR, nargout=0) # The shared MATLAB session outlives this server
+    except Exception as e_rmpath:
+        logger.warning("Could not remove %s from MATLAB path: %s", SCRIPT_CACHE_DIR, e_rmpath)
+    shutil.rmtree(SCRIPT_CACHE_DIR, ignore_errors=True)
+
+atexit.register(_remove_script_cache_dir)
+
+# Helper used by getVariables: reads only names that exist as base-workspace variables, so a name that
+# resolves to a function (figure, rand, a user function on the path) is reported missing instead of being called
+GETVARS_FN = "mcp_getvars"
+_GETVARS_SRC = """function [s, missing] = mcp_getvars(names)
+is_var = cellfun(@(v) evalin('base', ['exist(''' v ''',''var'')']) == 1, names);
+missing = names(~is_var);
+s = struct();
+if ~isempty(missing)
+    return
+end
+for k = 1:numel(names)
+    s.(names{k}) = evalin('base', names{k});
+end
+end
+"""
+with open(os.path.join(SCRIPT_CACHE_DIR, GETVARS_FN + ".m"), 'w', encoding='utf-8') as f:
+    f.write(_GETVARS_SRC)
+
+# Helper used by getVariable: one round-trip returning whether the name is a base-workspace variable,
+# its numel, the value itself when it has at most one element, and otherwise a fingerprint of its
+# class and value (keyHash, R2022b+; empty when unavailable or unsupported for the value)
+VARINFO_FN = "mcp_varinfo"
+_VARINFO_SRC = """function [is_var, n, value, fp] = mcp_varinfo(name)
+is_var = evalin('base', ['exist(''' name ''',''var'')']) == 1;
+n = 0; value = []; fp = '';
+if ~is_var
+    return
+end
+n = evalin('base', ['numel(' name ')']);
+if n <= 1
+    value = evalin('base', name);
+else
+    try
+        fp = evalin('base', ['sprintf(''%s:%u'', class(' name '), keyHash(' name '))']);
+    catch
+        fp = '';
+    end
+end
+end
+"""
+with open(os.path.join(SCRIPT_CACHE_DIR, VARINFO_FN + ".m"), 'w', encoding='utf-8') as f:
+    f.write(_VARINFO_SRC)
+
+def _drop_cached_script(h: str):
+    """
+    Removes a cached script from MATLAB's memory and from disk. Must run on the engine thread.
+    """
+    script_name = _code_cache.pop(h)
+    eng.clear(script_name, nargout=0)
+    with contextlib.suppress(OSError):
+        os.remove(os.path.join(SCRIPT_CACHE_DIR, script_name + ".m"))
+
+def run_cached_script(code: str) -> str:
+    """
+    Runs the code as a cached MATLAB script, writing it on first use, and returns the script name.
+    Scripts that raise are dropped, since they would most likely fail again; the cache is otherwise
+    bounded to MAX_CACHED_SCRIPTS by evicting the least recently used script.
+    Must run on the engine thread.
+    """
+    code_bytes = code.encode('utf-8')
+    h = hashlib.blake2b(code_bytes, digest_size=16).hexdigest()
+    script_name = _code_cache.get(h)
+    if script_name is None:
+        script_name = f"mcp_h{h}" # MATLAB identifiers cannot start with an underscore
+        script_path = os.path.join(SCRIPT_CACHE_DIR, script_name + ".m")
+        # Write the already-encoded bytes; a buffered writer either writes everything or raises.
+        # No fsync: MATLAB reads the file locally right away.
+        try:
+            with open(script_path, 'wb') as f:
+                f.write(code_bytes)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(script_path) # Never leave a truncated script behind
+            raise
+        _code_cache[h] = script_name
+        while len(_code_cache) > MAX_CACHED_SCRIPTS:
+            _drop_cached_script(next(iter(_code_cache)))
+    else:
+        _code_cache.move_to_end(h)
+    try:
+        # Invoking the script by name runs it in the base workspace
+        eng.eval(script_name, nargout=0)
+    except matlab.engine.MatlabExecutionError:
+        _drop_cached_script(h)
+        raise
+    return script_name
+
 # --- Helper Function ---
+# Numeric arrays larger than this are returned as a base64 float32 envelope instead of nested lists
+NDARRAY_INLINE_MAX_BYTES = 65_536
+
+# The MATLAB engine is not thread-safe, so every engine call goes through one dedicated worker thread
+MATLAB_EXEC = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="matlab-eng")
+
+async def run_eng(fn, *args, **kwargs) -> Any:
+    """
+    Runs a blocking MATLAB engine call on the dedicated engine thread.
+    """
+    if kwargs:
+        fn = functools.partial(fn, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(MATLAB_EXEC, fn, *args)
+
+_MATLAB_NAME_RE = re.compile(r'[A-Za-z]\w{0,62}', re.ASCII) # MATLAB identifiers are ASCII only
+
+def is_matlab_identifier(name: str) -> bool:
+    """
+    Checks that a name is a valid MATLAB variable name, so it is safe to interpolate into eval'd code.
+    """
+    return _MATLAB_NAME_RE.fullmatch(name) is not None
+
+def _orjson_default(obj: Any) -> Any:
+    # orjson only serializes C-contiguous arrays natively; anything else falls through to here
+    if isinstance(obj, np.ndarray):
+        if not obj.flags.c_contiguous:
+            return np.ascontiguousarray(obj) # orjson serializes the copy natively
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj)}")
+
+def dumps_response(payload: Dict[str, Any]) -> str:
+    """
+    Serializes a tool response to JSON text in a single pass (numpy arrays included).
+    """
+    return orjson.dumps(payload, default=_orjson_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+def text_response(payload: Dict[str, Any]) -> List[types.TextContent]:
+    """
+    Builds the MCP content for a tool response directly, so FastMCP does not serialize it a second time.
+    Tools returning it are registered with structured_output=False, otherwise FastMCP (mcp>=1.10) would
+    also send the same content as structuredContent.
+    """
+    return [types.TextContent(type="text", text=dumps_response(payload))]
+
+def _matlab_ndarray(data: Any, dtype: Any) -> np.ndarray:
+    """
+    Views a MATLAB engine array as a numpy array without per-element copying.
+    matlab.* arrays keep their elements in a flat column-major array.array in ._data.
+    Raises TypeError for data that cannot be represented with the given dtype, such as complex arrays.
+    """
+    if getattr(data, "_is_complex", False):
+        raise TypeError(f"Complex MATLAB arrays are not supported for conversion: {type(data)}")
+    try:
+        buf = memoryview(data._data)
+        np_array = np.frombuffer(buf, dtype=buf.format).astype(dtype, copy=False)
+        return np_array.reshape(tuple(data.size), order='F')
+    except (AttributeError, TypeError, ValueError):
+        pass
+    try:
+        return np.asarray(data, dtype=dtype)
+    except (TypeError, ValueError) as e_conv:
+        raise TypeError(f"Could not convert {type(data)} to a numpy array: {e_conv}") from e_conv
+
+def _conv_float(data: Any, dtype: Any = np.float64) -> Any:
+    np_array = _matlab_ndarray(data, dtype)
+    if np_array.size == 1: return np_array.item()
+    np_array = np_array.squeeze() # squeeze() is a view; keeps row/column vectors as flat lists
+    if np_array.nbytes > NDARRAY_INLINE_MAX_BYTES:
+        # Downcast to little-endian float32, row-major, to keep large payloads compact
+        arr32 = np.ascontiguousarray(np_array, dtype="<f4")
+        return {
+            "__ndarray__": True, "dtype": "float32", "shape": list(arr32.shape),
+            "data": base64.b64encode(arr32.tobytes()).decode("ascii"),
+        }
+    return np_array
+
+def _conv_array(data: Any, dtype: Any) -> Any:
+    np_array = _matlab_ndarray(data, dtype)
+    if np_array.size == 1: return np_array.item()
+    return np_array.squeeze()
+
+# Exact-type dispatch table: one dict lookup instead of a chain of isinstance() checks
+_CONV = {
+    matlab.double: functools.partial(_conv_float, dtype=np.float64),
+    matlab.single: functools.partial(_conv_float, dtype=np.float32),
+    matlab.logical: functools.partial(_conv_array, dtype=np.bool_),
+}
+for _int_type in ("int8", "uint8", "int16", "uint16", "int32", "uint32", "int64", "uint64"):
+    _CONV[getattr(matlab, _int_type)] = functools.partial(_conv_array, dtype=np.dtype(_int_type))
+if hasattr(matlab, "char"): # Not provided by every matlabengine release
+    _CONV[matlab.char] = str
+
 def matlab_to_python(data: Any) -> Any:
     """
     Converts common MATLAB data types returned by the engine into JSON-Serializable Python types.
+    Numeric and logical arrays are returned as numpy arrays, which dumps_response() serializes natively.
+    Single-element arrays become Python scalars.
     """
+    fn = _CONV.get(type(data))
+    if fn:
+        return fn(data)
     if isinstance(data, (str, int, float, bool, type(None))):
         return data
-    elif isinstance(data, matlab.double):
-        np_array = np.array(data).squeeze()
-        if np_array.ndim == 0: return float(np_array)
-        return np_array.tolist() # Handles vectors and matrices to lists/nested lists
-    elif isinstance(data, matlab.logical):
-        np_array = np.array(data).squeeze()
-        if np_array.ndim == 0: return bool(np_array)
-        return np_array.tolist()
-    elif isinstance(data, matlab.char):
+    logger.warning("Unsupported MATLAB type encountered for conversion: %s. Attempting string representation.", type(data))
+    try:
         return str(data)
-    else:
-        logger.warning(f"Unsupported MATLAB type encountered for conversion: {type(data)}. Attempting string representation.")
-        try:
-            return str(data)
-        except Exception as e_str_conv:
-            logger.error(f"Could not convert type {type(data)} to string: {e_str_conv}")
-            return f"Unserializable MATLAB Type: {type(data)}"
+    except Exception as e_str_conv:
+        logger.error("Could not convert type %s to string: %s", type(data), e_str_conv)
+        return f"Unserializable MATLAB Type: {type(data)}"
     # --- TODO: Add more MATLAB types like structs, cell arrays, tables ---
 
+# --- Variable cache ---
+# Serialized getVariable responses for non-scalar variables, keyed by name and validated against a
+# fingerprint of the current value, so repeated polling of an unchanged variable skips fetch/convert/serialize.
+# whos() carries no modification time, so the fingerprint (computed by mcp_varinfo) hashes the value itself.
+VAR_CACHE_TTL = 30.0 # seconds
+VAR_CACHE_MAX_BYTES = 64 * 1024 * 1024 # total size of cached response text
+# name -> (fingerprint, stored at, response, response size); insertion order is oldest first
+_var_cache: Dict[str, Tuple[str, float, List[types.TextContent], int]] = {}
+
+def _prune_var_cache():
+    """
+    Drops expired entries. Called on every getVariable, so memory is released even when only
+    scalars or other names are requested after polling of a large variable stops.
+    """
+    now = time.monotonic()
+    for stale in [k for k, entry in _var_cache.items() if now - entry[1] >= VAR_CACHE_TTL]:
+        del _var_cache[stale]
+
+def _lookup_var_cache(name: str, fingerprint: Optional[str]) -> Optional[List[types.TextContent]]:
+    """
+    Returns the cached response if it still matches the fingerprint; a mismatching entry is dropped.
+    """
+    cached = _var_cache.get(name)
+    if cached is None:
+        return None
+    if fingerprint is None or cached[0] != fingerprint:
+        del _var_cache[name]
+        return None
+    return cached[2]
+
+def _store_var_cache(name: str, fingerprint: str, response: List[types.TextContent]):
+    size = len(response[0].text)
+    _var_cache.pop(name, None)
+    if size > VAR_CACHE_MAX_BYTES:
+        return
+    total = sum(entry[3] for entry in _var_cache.values())
+    while _var_cache and total + size > VAR_CACHE_MAX_BYTES:
+        oldest = next(iter(_var_cache))
+        total -= _var_cache.pop(oldest)[3]
+    _var_cache[name] = (fingerprint, time.monotonic(), response, size)
+
 # --- Tool Definitions ---
-@mcp.tool()
-async def runMatlabCode(code: str) -> Dict[str, Any]:
+# Limits for runMatlabCode payloads, checked before anything reaches MATLAB or the filesystem
+MAX_CODE_CHARS = 1_048_576
+MAX_CODE_LINES = 50_000
+
+@mcp.tool(structured_output=False)
+async def runMatlabCode(code: str) -> List[types.TextContent]:
     """
     Runs arbitrary MATLAB code in the shared MATLAB session.
     WARNING: Executing arbitrary code can be a security risk.
-    This tool attempts execution via a temporary file first, then falls back to eng.evalc() to capture output.
+    This tool executes via eng.evalc() first to capture output, and only falls back to a temporary .m file
+    when the code defines a function or eng.evalc() fails.
 
     Args:
         code: The MATLAB code string to execute.
 
     Returns:
-        A dictionary with:
+        A single text content item holding a JSON-encoded dictionary with:
         - "status": "success" or "error"
         - "output": (on success) A message indicating success or the captured output from eng.evalc().
         - "error_type": (on error) The type of Python exception.
         - "stage": (on error) The stage of execution where the error occurred.
         - "message": (on error) A detailed error message.
     """
-    logger.info(f"runMatlabCode request: {code[:150]}...") # Log a bit more of the code
+    logger.info("runMatlabCode request: %s...", code[:150]) # Log a bit more of the code
 
     if not eng: # Should be caught at startup, but good check
         logger.error("runMatlabCode: MATLAB engine not available.")
-        return {"status": "error", "error_type": "RuntimeError", "message": "MATLAB engine not available."}
+        return text_response({"status": "error", "error_type": "RuntimeError", "message": "MATLAB engine not available."})
+    if len(code) > MAX_CODE_CHARS or code.count("\n") + (not code.endswith("\n")) > MAX_CODE_LINES:
+        logger.warning("runMatlabCode: Rejected oversized code payload (%s chars).", len(code))
+        return text_response({"status": "error", "error_type": "ValueError", "message": f"Code too large: limit is {MAX_CODE_CHARS} characters and {MAX_CODE_LINES} lines."})
 
-    temp_file_path = None
     try:
-        # --- Attempt 1: Execute using a temporary .m file ---
-        # This is often more robust for multi-line scripts or function definitions
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".m", delete=False, encoding='utf-8') as tmp:
-            tmp.write(code)
-            temp_file_path = tmp.name
-        logger.debug(f"Attempting to run code via temporary file: {temp_file_path}")
-        # Run blocking MATLAB call in a thread
-        await asyncio.to_thread(eng.run, temp_file_path, nargout=0)
-        logger.info(f"Code executed successfully using temporary file: {temp_file_path}")
-        return {"status": "success", "output": f"Code executed successfully via temporary file ({os.path.basename(temp_file_path)})."}
-
-    except matlab.engine.MatlabExecutionError as e_run:
-        # This error means MATLAB itself had an issue running the code in the temp file
-        logger.warning(f"Temporary file execution failed: {e_run}. Attempting eng.evalc() as fallback...")
-
-        # --- Attempt 2: Fallback to eng.evalc() to capture output ---
+        # Code that starts with a function definition needs script-file semantics
+        needs_file = re.match(r'\s*function\b', code) is not None
+
+        if not needs_file:
+            # --- Attempt 1: Execute directly with eng.evalc() (no disk I/O) ---
+            try:
+                result = await run_eng(eng.evalc, code)
+                logger.info("Code executed successfully using eng.evalc().")
+                return text_response({"status": "success", "output": result})
+            except matlab.engine.MatlabExecutionError as e_evalc:
+                logger.warning("eng.evalc() execution failed: %s. Attempting temporary file as fallback...", e_evalc)
+
+        # --- Attempt 2: Execute using a cached .m script ---
+        # Needed for function definitions and some multi-line scripts
         try:
-            result = await asyncio.to_thread(eng.evalc, code)
-            logger.info("Code executed successfully using eng.evalc() fallback.")
-            return {"status": "success", "output": result}
-        except matlab.engine.MatlabExecutionError as e_evalc:
-            logger.error(f"eng.evalc() fallback also failed: {e_evalc}", exc_info=True)
-            return {
+            # Run blocking MATLAB calls (and the cache bookkeeping that goes with them) on the engine thread
+            script_name = await run_eng(run_cached_script, code)
+            logger.info("Code executed successfully using cached script: %s", script_name)
+            return text_response({"status": "success", "output": f"Code executed successfully via temporary file ({script_name}.m)."})
+        except matlab.engine.MatlabExecutionError as e_run:
+            logger.error("Cached script execution failed: %s", e_run)
+            return text_response({
                 "status": "error", "error_type": "MatlabExecutionError",
-                "stage": "evalc_fallback",
-                "message": f"MATLAB execution failed (tried temp file then evalc): {str(e_evalc)}"
-            }
-        except Exception as e_evalc_other: # Catch other errors during evalc
-            logger.error(f"Unexpected error during eng.evalc() fallback: {e_evalc_other}", exc_info=True)
-            return {
-                "status": "error", "error_type": e_evalc_other.__class__.__name__,
-                "stage": "evalc_fallback",
-                "message": f"Unexpected error during eng.evalc() fallback: {str(e_evalc_other)}"
-            }
+                "stage": "temp_file" if needs_file else "temp_file_fallback",
+                "message": f"MATLAB execution failed ({'temp file' if needs_file else 'tried evalc then temp file'}): {str(e_run)}"
+            })
 
     except matlab.engine.EngineError as e_eng: # Errors related to engine communication
-        logger.error(f"MATLAB Engine communication error in runMatlabCode: {e_eng}", exc_info=True)
-        return {"status": "error", "error_type": "EngineError", "message": f"MATLAB Engine error: {str(e_eng)}"}
+        logger.error("MATLAB Engine communication error in runMatlabCode: %s", e_eng, exc_info=True)
+        return text_response({"status": "error", "error_type": "EngineError", "message": f"MATLAB Engine error: {str(e_eng)}"})
     except IOError as e_io: # Catch errors related to temp file I/O
-        logger.error(f"IOError during temporary file operation for runMatlabCode: {e_io}", exc_info=True)
-        return {"status": "error", "error_type": "IOError", "message": f"File operation error: {str(e_io)}"}
+        logger.error("IOError during temporary file operation for runMatlabCode: %s", e_io, exc_info=True)
+        return text_response({"status": "error", "error_type": "IOError", "message": f"File operation error: {str(e_io)}"})
     except Exception as e_outer: # Catch-all for other unexpected errors
-        logger.error(f"Unexpected error in runMatlabCode: {e_outer}", exc_info=True)
-        return {"status": "error", "error_type": e_outer.__class__.__name__, "message": f"An unexpected error occurred: {str(e_outer)}"}
-    finally:
-        # --- Cleanup: Ensure temporary file is deleted ---
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logger.debug(f"Cleaned up temporary file: {temp_file_path}")
-            except OSError as e_cleanup:
-                logger.warning(f"Could not clean up temporary file {temp_file_path}: {e_cleanup}")
+        logger.error("Unexpected error in runMatlabCode: %s", e_outer, exc_info=True)
+        return text_response({"status": "error", "error_type": e_outer.__class__.__name__, "message": f"An unexpected error occurred: {str(e_outer)}"})
 
 
-@mcp.tool()
-async def getVariable(variable_name: str) -> Dict[str, Any]:
+@mcp.tool(structured_output=False)
+async def getVariable(variable_name: str) -> List[types.TextContent]:
 
 
     """
@@ -167,59 +400,143 @@ async def getVariable(variable_name: str) -> Dict[str, Any]:
         variable_name: The name of the variable to retrieve.
 
     Returns:
-        A dictionary with:
+        A single text content item holding a JSON-encoded dictionary with:
         - "status": "success" or "error"
         - "variable": (on success) The name of the variable.
         - "value": (on success) The JSON-serializable value of the variable.
+          Floating-point arrays larger than 64 KiB are returned as an envelope instead of nested lists:
+          {"__ndarray__": true, "dtype": "float32", "shape": [...], "data": "<base64>"},
+          where "data" holds little-endian float32 values in row-major order.
         - "error_type": (on error) The type of Python exception.
         - "message": (on error) A detailed error message.
     """
 
 
 
-    logger.info(f"getVariable request for: '{variable_name}'")
+    logger.info("getVariable request for: '%s'", variable_name)
 
     if not eng: # Should be caught at startup
         logger.error("getVariable: MATLAB engine not available.")
-        return {"status": "error", "error_type": "RuntimeError", "message": "MATLAB engine not available."}
+        return text_response({"status": "error", "error_type": "RuntimeError", "message": "MATLAB engine not available."})
     if not variable_name or not isinstance(variable_name, str): # Basic input validation
-        logger.warning(f"getVariable: Invalid variable_name provided: {variable_name}")
-        return {"status": "error", "error_type": "ValueError", "message": "Invalid variable_name: must be a non-empty string."}
+        logger.warning("getVariable: Invalid variable_name provided: %s", variable_name)
+        return text_response({"status": "error", "error_type": "ValueError", "message": "Invalid variable_name: must be a non-empty string."})
 
     try:
-        # Synchronous part for asyncio.to_thread
+        # Synchronous part for run_eng
         def get_var_from_matlab_sync():
-            # Check if variable exists directly in the workspace
-            if variable_name not in eng.workspace:
+            _prune_var_cache()
+            # A name that is not a valid MATLAB identifier cannot be a workspace variable
+            if not is_matlab_identifier(variable_name):
                 raise KeyError(f"Variable '{variable_name}' not found in MATLAB workspace.")
-            return eng.workspace[variable_name]
-
-        matlab_value = await asyncio.to_thread(get_var_from_matlab_sync)
-        python_value = matlab_to_python(matlab_value)
-
-        # Test JSON serialization of the converted value
-        try:
-            json.dumps({"test_value": python_value}) # Wrapped in a dict for a robust test
-            logger.info(f"Successfully retrieved and converted variable '{variable_name}'.")
-            return {"status": "success", "variable": variable_name, "value": python_value}
-        except TypeError as json_err:
-            logger.error(f"Serialization Error: Failed to serialize MATLAB value for '{variable_name}' (type: {type(matlab_value)}, py_type: {type(python_value)}) after conversion: {json_err}", exc_info=True)
-            return {
-                "status": "error", "error_type": "TypeError",
-                "message": f"Value for variable '{variable_name}' could not be JSON serialized after conversion. Original MATLAB type: {type(matlab_value)}"
-            }
+            # One round-trip for existence, size, and either the scalar value or the fingerprint
+            is_var, n, scalar_value, fingerprint = eng.feval(VARINFO_FN, variable_name, nargout=4)
+            if not is_var:
+                _var_cache.pop(variable_name, None)
+                raise KeyError(f"Variable '{variable_name}' not found in MATLAB workspace.")
+            if n <= 1:
+                _var_cache.pop(variable_name, None)
+                matlab_value = scalar_value
+                fingerprint = None
+            else:
+                fingerprint = fingerprint or None # Empty when keyHash is unavailable for this value
+                cached = _lookup_var_cache(variable_name, fingerprint)
+                if cached is not None:
+                    logger.debug("getVariable: Serving '%s' from cache.", variable_name)
+                    return cached
+                matlab_value = eng.workspace[variable_name]
+
+            # Convert and serialize once on the engine thread, so large arrays don't block the event loop
+            python_value = None
+            try:
+                python_value = matlab_to_python(matlab_value)
+                response = text_response({"status": "success", "variable": variable_name, "value": python_value})
+            except TypeError as json_err: # Unsupported value (e.g. complex array) or orjson.JSONEncodeError
+                logger.error("Serialization Error: Failed to serialize MATLAB value for '%s' (type: %s, py_type: %s) after conversion: %s", variable_name, type(matlab_value), type(python_value), json_err, exc_info=True)
+                return text_response({
+                    "status": "error", "error_type": "TypeError",
+                    "message": f"Value for variable '{variable_name}' could not be JSON serialized after conversion. Original MATLAB type: {type(matlab_value)}"
+                })
+            if fingerprint is not None:
+                _store_var_cache(variable_name, fingerprint, response)
+            logger.info("Successfully retrieved and converted variable '%s'.", variable_name)
+            return response
+
+        return await run_eng(get_var_from_matlab_sync)
 
     except KeyError as ke: # Variable not found
-        logger.warning(f"getVariable: {ke}")
-        return {"status": "error", "error_type": "KeyError", "message": str(ke)}
+        logger.warning("getVariable: %s", ke)
+        return text_response({"status": "error", "error_type": "KeyError", "message": str(ke)})
     except matlab.engine.EngineError as e_eng:
-        logger.error(f"MATLAB Engine error during getVariable for '{variable_name}': {e_eng}", exc_info=True)
-        return {"status": "error", "error_type": "EngineError", "message": f"MATLAB Engine error: {str(e_eng)}"}
+        logger.error("MATLAB Engine error during getVariable for '%s': %s", variable_name, e_eng, exc_info=True)
+        return text_response({"status": "error", "error_type": "EngineError", "message": f"MATLAB Engine error: {str(e_eng)}"})
     except Exception as e:
-        logger.error(f"Unexpected error in getVariable for '{variable_name}': {e}", exc_info=True)
-        return {"status": "error", "error_type": e.__class__.__name__, "message": f"An unexpected error occurred: {str(e)}"}
+        logger.error("Unexpected error in getVariable for '%s': %s", variable_name, e, exc_info=True)
+        return text_response({"status": "error", "error_type": e.__class__.__name__, "message": f"An unexpected error occurred: {str(e)}"})
+
 
 
+@mcp.tool(structured_output=False)
+async def getVariables(variable_names: List[str]) -> List[types.TextContent]:
+    """
+    Gets the values of several variables from the MATLAB workspace in a single engine round-trip.
+
+    Args:
+        variable_names: The names of the variables to retrieve.
+
+    Returns:
+        A single text content item holding a JSON-encoded dictionary with:
+        - "status": "success" or "error"
+        - "values": (on success) A mapping of variable name to its JSON-serializable value
+          (large numeric arrays use the same envelope as getVariable).
+        - "error_type": (on error) The type of Python exception.
+        - "message": (on error) A detailed error message.
+    """
+    logger.info("getVariables request for: %s", variable_names)
+
+    if not eng: # Should be caught at startup
+        logger.error("getVariables: MATLAB engine not available.")
+        return text_response({"status": "error", "error_type": "RuntimeError", "message": "MATLAB engine not available."})
+    if not variable_names or not all(isinstance(n, str) and is_matlab_identifier(n) for n in variable_names):
+        logger.warning("getVariables: Invalid variable_names provided: %s", variable_names)
+        return text_response({"status": "error", "error_type": "ValueError", "message": "Invalid variable_names: must be a non-empty list of valid MATLAB variable names."})
+
+    names = list(dict.fromkeys(variable_names)) # Struct field names must be unique
+
+    try:
+        def get_vars_from_matlab_sync():
+            # One round-trip: existence check and collection both happen inside the MATLAB helper
+            matlab_struct, missing = eng.feval(GETVARS_FN, names, nargout=2)
+            if missing:
+                raise KeyError(f"Variable(s) {list(missing)} not found in MATLAB workspace.")
+            # Convert and serialize on the engine thread too, so large arrays don't block the event loop
+            values = {}
+            for n in names:
+                try:
+                    values[n] = matlab_to_python(matlab_struct[n])
+                except TypeError as e_conv: # e.g. complex arrays
+                    raise TypeError(f"Value for variable '{n}' could not be JSON serialized after conversion. Original MATLAB type: {type(matlab_struct[n])}") from e_conv
+            return text_response({"status": "success", "values": values})
+
+        payload = await run_eng(get_vars_from_matlab_sync)
+        logger.info("Successfully retrieved and converted %s variables.", len(names))
+        return payload
+    except KeyError as ke: # One or more variables not found
+        logger.warning("getVariables: %s", ke)
+        return text_response({"status": "error", "error_type": "KeyError", "message": str(ke)})
+    except TypeError as e_type: # A value could not be converted or serialized
+        logger.error("Serialization Error: Failed to serialize MATLAB values for %s: %s", names, e_type, exc_info=True)
+        return text_response({"status": "error", "error_type": "TypeError", "message": str(e_type)})
+    except matlab.engine.MatlabExecutionError as e_exec:
+        logger.warning("getVariables: MATLAB could not collect %s: %s", names, e_exec)
+        return text_response({"status": "error", "error_type": "MatlabExecutionError", "message": f"Could not retrieve variables {names}: {str(e_exec)}"})
+    except matlab.engine.EngineError as e_eng:
+        logger.error("MATLAB Engine error during getVariables for %s: %s", names, e_eng, exc_info=True)
+        return text_response({"status": "error", "error_type": "EngineError", "message": f"MATLAB Engine error: {str(e_eng)}"})
+    except Exception as e:
+        logger.error("Unexpected error in getVariables for %s: %s", names, e, exc_info=True)
+        return text_response({"status": "error", "error_type": e.__class__.__name__, "message": f"An unexpected error occurred: {str(e)}"})
+
 if __name__ == "__main__":
     logger.info("Starting MATLAB MCP server...")
     # mcp.run() blocks until shutdown
@@ -21,6 +21,10 @@ class Database:
         """Add two numbers together"""
         return a + b
 
+# Bind the methods once so tools skip the per-call attribute lookup
+_QUERY = Database.query
+_ADD = Database.add
+
 # Define a type-safe context class
 @dataclass
 class AppContext:
@@ -29,7 +33,8 @@ class AppContext:
 # Create the lifespan context manager
 @asynccontextmanager
 async def app_lifespan(server: FastMCP) -> AsyncIterator[AppContext]:
-    # Initialize resources on startup
+    # Initialize resources on startup; this single connection (or a pool, e.g. asyncpg.create_pool,
+    # for a real database) is shared by every tool call instead of connecting per call
     db = await Database.connect()
     try:
         # Make resources available during operation
@@ -50,15 +55,13 @@ mcp = FastMCP(
 @mcp.tool() 
 def query_db(ctx: Context) -> str: 
     """Tool that uses initialized resources""" 
-    db = ctx.request_context.lifespan_context.db 
-    return db.query()
+    return _QUERY(ctx.request_context.lifespan_context.db)
 
 # Add a simple calculator tool
 @mcp.tool()
 def add(ctx: Context, a: int, b: int) -> int:
     """Add two numbers using Database instance"""
-    db = ctx.request_context.lifespan_context.db
-    return db.add(a, b)
+    return _ADD(ctx.request_context.lifespan_context.db, a, b)
 
 # Run the server
 if __name__ == "__main__":